@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 
-import random
 import enum
 import argparse
+import copy
+import functools
+import string
 import json
-from typing import List, Dict, Optional, NewType
+import time
+from typing import List, Dict, Optional, NewType, Tuple
 
 #    0   1   2   3   4   5   6
 #       13  12  11  10   9   8   7
@@ -12,41 +15,144 @@ from typing import List, Dict, Optional, NewType
 Pot = NewType('Pot', int)
 Pos = NewType('Pos', int)
 
+# transposition table entry flags: the stored score is exact, or only
+# a lower / upper bound because the search was cut off by alpha-beta
+EXACT, LOWER, UPPER = 0, 1, 2
+INF = float("inf")
 
-class Player(enum.Enum):
-    ONE = 1
-    TWO = 2
+# when deepening the search, first look for a score within this much
+# of the previous depth's score, on the grounds that it rarely moves far
+ASPIRATION_WINDOW = 2
+
+# the board is packed into a single int, with each pot taking up
+# PACK_SHIFT bits - pot i is at (bits >> (i * PACK_SHIFT)) & PACK_MASK.
+# Pots are whole bytes, so bits is the board as little-endian bytes
+# (and a standard 14-pot board fits in two 64-bit words)
+PACK_SHIFT = 8
+PACK_MASK = (1 << PACK_SHIFT) - 1
 
-    @property
-    def other(self) -> "Player":
-        """
-        >>> Player.ONE.other == Player.TWO
-        True
-        >>> Player.TWO.other == Player.ONE
-        True
-        """
-        return Player.ONE if self == Player.TWO else Player.TWO
+
+# players are plain ints underneath, so that the search can use them
+# to index per-player tables, and get the opponent with `1 - player`
+class Player(enum.IntEnum):
+    """
+    >>> Player(1 - Player.ONE) == Player.TWO
+    True
+    >>> Player(1 - Player.TWO) == Player.ONE
+    True
+    """
+    ONE = 0
+    TWO = 1
 
 
 def display_row(ns):
-    return " ".join(["%2d" % x for x in ns])
+    """
+    >>> display_row([0, 3, 12])
+    ' 0  3 12'
+    """
+    return " ".join(map("{:2d}".format, ns))
+
+
+class Rules:
+    """
+    Everything which only depends on the size of the board, worked out
+    once and shared by every State of that size (see rules_for())
+    """
+    def __init__(self, end: int) -> None:
+        self.START = Pos(0)
+        self.HALF = Pos(end // 2)
+        self.END = Pos(end)
+        self.POTS = [Pot(n) for n in range(1, self.HALF)]
+        self.OFFSETS = [self.START, self.HALF]
+        # multiplying by ONES adds every pot up into the top pot's bits
+        # (which can't overflow, since the whole board fits in one pot)
+        self.ONES = sum(1 << (i * PACK_SHIFT) for i in range(self.END))
+        self.SIDE_SHIFT = self.HALF * PACK_SHIFT
+        self.P1_MASK = (1 << self.SIDE_SHIFT) - 1
+
+        # every pot (but not base) on each player's side, for checking
+        # whether they can move at all; and the low bits / top bit of
+        # every pot, for finding which pots are non-empty in one go
+        self.SIDE_MASK = [
+            sum(PACK_MASK << ((self.OFFSETS[player] + pot) * PACK_SHIFT) for pot in self.POTS)
+            for player in Player
+        ]
+        self.POT_LOW = self.ONES * (PACK_MASK >> 1)
+        self.POT_HIGH = self.ONES << (PACK_SHIFT - 1)
+        self.POT_OF_BIT = {
+            1 << ((self.OFFSETS[player] + pot + 1) * PACK_SHIFT - 1): pot
+            for player in Player
+            for pot in self.POTS
+        }
+
+        # whether each position is in player one's / player two's range,
+        # and the position opposite each one (or None for bases)
+        self.IS_P1 = tuple(pos != self.START and pos < self.HALF for pos in range(self.END))
+        self.IS_P2 = tuple(pos > self.HALF for pos in range(self.END))
+        self.IS_OWN = [self.IS_P1, self.IS_P2]
+        self.OPPOSITE = tuple(None if pos in self.OFFSETS else Pos(self.END - pos) for pos in range(self.END))
+
+        # for each player and pot, the positions that beads get dropped into,
+        # in order, skipping the opponent's base. SOW_DELTA[n] is how much
+        # dropping into the first n of those adds to bits, so the last
+        # entry is one full lap of the board
+        self.SOW_PATH: List[Dict[Pot, tuple]] = [{}, {}]
+        self.SOW_DELTA: List[Dict[Pot, list]] = [{}, {}]
+        for player in Player:
+            skip = self.OFFSETS[1 - player]
+            for src_pos in self.POTS:
+                start = self.OFFSETS[player] + src_pos
+                path = tuple(
+                    Pos((start - n) % self.END)
+                    for n in range(1, self.END + 1)
+                    if (start - n) % self.END != skip
+                )
+                deltas = [0]
+                for pos in path:
+                    deltas.append(deltas[-1] + (1 << (pos * PACK_SHIFT)))
+                self.SOW_PATH[player][src_pos] = path
+                self.SOW_DELTA[player][src_pos] = deltas
+
+
+@functools.lru_cache(maxsize=None)
+def rules_for(end: int) -> Rules:
+    """
+    >>> rules_for(14) is rules_for(14)
+    True
+    """
+    return Rules(end)
 
 
 class State:
-    def __init__(self, board, runs=100, verbose=False) -> None:
-        assert (len(board) % 2) == 0, f"Board length must be even, not {self.END}"
-        self.board = board
-        self.runs = runs
+    def __init__(self, board, depth=8, verbose=False, time_limit=None) -> None:
+        assert (len(board) % 2) == 0, f"Board length must be even, not {len(board)}"
+        assert sum(board) <= PACK_MASK, f"Board can hold at most {PACK_MASK} beads"
+        assert min(board) >= 0, "Pots can't hold negative beads"
+        assert depth >= 1, f"Search depth must be at least 1, not {depth}"
+        self.bits = int.from_bytes(bytes(board), "little")
+        self.depth = depth
         self.verbose = verbose
+        self.time_limit = time_limit
+        # keyed on bits as seen by the player to move (see _negamax())
+        self._tt: Dict[int, tuple] = {}
 
-        self.START = Pos(0)
-        self.HALF = Pos(len(board) // 2)
-        self.END = Pos(len(board))
-        self.POTS = [Pot(n) for n in range(1, self.HALF)]
-        self.OFFSETS = {
-            Player.ONE: self.START,
-            Player.TWO: self.HALF,
-        }
+        self.rules = rules_for(len(board))
+        self.START = self.rules.START
+        self.HALF = self.rules.HALF
+        self.END = self.rules.END
+        self.POTS = self.rules.POTS
+        self.OFFSETS = self.rules.OFFSETS
+
+    @property
+    def board(self) -> List[int]:
+        """
+        >>> State([0, 1, 2, 3, 4, 5, 6, 0, 1, 2, 3, 4, 5, 6]).board
+        [0, 1, 2, 3, 4, 5, 6, 0, 1, 2, 3, 4, 5, 6]
+        """
+        return list(self.bits.to_bytes(self.END, "little"))
+
+    def _get(self, pos: Pos) -> int:
+        return (self.bits >> (pos * PACK_SHIFT)) & PACK_MASK
 
     def __str__(self) -> str:
         return "%s    \n   %s" % (
@@ -63,8 +169,10 @@ class State:
         True
         >>> State([1, 2, 4, 5]) == State([1, 2, 3, 5])
         False
+        >>> State([1, 2, 0, 0]) == State([1, 2, 0, 0, 0, 0])
+        False
         """
-        return self.board == b.board
+        return self.END == b.END and self.bits == b.bits
 
     def in_p1_range(self, pos: Pos) -> bool:
         """
@@ -77,7 +185,7 @@ class State:
         [False, True, True, True, False, False, False, False]
         """
         assert 0 <= pos < self.END
-        return pos != self.OFFSETS[Player.ONE] and ((pos // self.HALF) % 2) == 0
+        return self.rules.IS_P1[pos]
 
     def in_p2_range(self, pos: Pos) -> bool:
         """
@@ -90,7 +198,7 @@ class State:
         [False, False, False, False, False, True, True, True]
         """
         assert 0 <= pos < self.END
-        return pos != self.OFFSETS[Player.TWO] and ((pos // self.HALF) % 2) == 1
+        return self.rules.IS_P2[pos]
 
     def get_opposite(self, pos: Pos) -> Optional[Pos]:
         """
@@ -105,9 +213,7 @@ class State:
         [None, 7, 6, 5, None, 3, 2, 1]
         """
         assert 0 <= pos < self.END
-        if pos in self.OFFSETS.values():
-            return None
-        return Pos(self.END - pos)
+        return self.rules.OPPOSITE[pos]
 
     def move(self, player: Player, src_pos: Pot) -> "State":
         """
@@ -140,46 +246,33 @@ class State:
         >>> State([0, 0, 0, 2, 0, 0, 0, 2]).move(Player.TWO, Pot(3))
         State([0, 0, 0, 0, 2, 1, 1, 0])
         """
-        assert src_pos in self.POTS, "Invalid choice of pot"
-        new_board = [x for x in self.board]
-        pos = self.OFFSETS[player] + src_pos
+        s = copy.copy(self)
+        s._tt = {}
+        s.do_move(player, src_pos)
+        return s
 
-        # pick up beads from the given spot
-        beads = new_board[pos]
-        if beads == 0:
+    def do_move(self, player: Player, src_pos: Pot) -> int:
+        """
+        Make a move in-place, returning a record which can be passed
+        to undo_move() to get back to where we started
+
+        >>> s = State([0, 0, 0, 2, 0, 0, 0, 2])
+        >>> record = s.do_move(Player.ONE, Pot(3))
+        >>> s
+        State([2, 1, 1, 0, 0, 0, 0, 0])
+        >>> s.undo_move(record)
+        >>> s
+        State([0, 0, 0, 2, 0, 0, 0, 2])
+        """
+        assert src_pos in self.POTS, "Invalid choice of pot"
+        if self._get(Pos(self.OFFSETS[player] + src_pos)) == 0:
             raise Exception("Can't move a spot with 0 beads")
-        new_board[pos] = 0
-
-        # drop off beads around the board
-        while True:
-            pos = (pos - 1) % self.END
-
-            # skip the opponent's base
-            if not (
-                (player == Player.ONE and pos == self.OFFSETS[Player.TWO]) or
-                (player == Player.TWO and pos == self.OFFSETS[Player.ONE])
-            ):
-                new_board[pos] += 1
-                beads -= 1
-            if beads == 0:
-                break
-        final_pos = pos
-
-        # if our final bead is placed in an empty space,
-        # then claim any beads opposite
-        if final_pos != self.OFFSETS[Player.ONE] and final_pos != self.OFFSETS[Player.TWO]:
-            # if our current place has 1 now, then it was empty before
-            if new_board[final_pos] == 1:
-                if (
-                    (player == Player.ONE and self.in_p1_range(final_pos)) or
-                    (player == Player.TWO and self.in_p2_range(final_pos))
-                ):
-                    opposite = self.get_opposite(final_pos)
-                    new_board[self.OFFSETS[player]] += new_board[opposite]
-                    new_board[opposite] = 0
-
-        # return new state
-        return State(new_board, self.runs, self.verbose)
+        before = self.bits
+        self.bits = _apply(self.rules, self.bits, player, src_pos)
+        return self.bits - before
+
+    def undo_move(self, record: int) -> None:
+        self.bits -= record
 
     def possible_moves(self, player: Player) -> List[Pot]:
         """
@@ -195,13 +288,13 @@ class State:
         >>> State([0, 3, 0, 3, 0, 3, 3, 0, 3, 3, 3, 3, 0, 0]).possible_moves(Player.TWO)
         [1, 2, 3, 4]
         """
-        offset = self.OFFSETS[player]
-        return [
-            pot
-            for pot
-            in self.POTS
-            if self.board[offset + pot]
-        ]
+        moves = _legal_moves(self.rules, self.bits, player)
+        pots = []
+        while moves:
+            bit = moves & -moves
+            moves ^= bit
+            pots.append(self.rules.POT_OF_BIT[bit])
+        return pots
 
     def p1_wins_by(self) -> int:
         """
@@ -212,10 +305,7 @@ class State:
         >>> State([1, 1, 1, 1, 1, 1]).p1_wins_by()
         0
         """
-        s1 = sum(self.board[0:self.HALF])
-        s2 = sum(self.board[self.HALF:self.END])
-        # return (s1>s2)-(s1<s2)
-        return s1 - s2
+        return _p1_wins_by(self.rules, self.bits)
 
     def tree(self, player: Player) -> int:
         """
@@ -251,55 +341,71 @@ class State:
         ..     x = State([0, 3, 3, 3, 3, 3, 3, 0, 3, 3, 3, 3, 3, 3]).tree(Player.ONE)
         >> (time.time() - t1) < 5.0  # check that 10,000 trees takes < 5s
         """
-        if not self.possible_moves(player.other):
-            return self.p1_wins_by()
+        sign = -1 if player else 1
+        return sign * self.negamax(player, self.depth, -INF, INF)
 
-        possible_moves = self.possible_moves(player)
-        if not possible_moves:
-            return self.p1_wins_by()
+    def negamax(self, player: Player, depth: int, alpha: float, beta: float) -> int:
+        """
+        Alpha-beta search `depth` moves ahead, returning the win margin
+        from the point of view of `player`. Once we run out of depth, the
+        current margin is used as an estimate.
 
-        n = random.choice(possible_moves)
-        s = self.move(player, n)
-        return s.tree(player.other)
+        >>> State([0, 1, 1, 0, 1, 1]).negamax(Player.ONE, 8, -INF, INF)
+        2
+        >>> State([0, 1, 1, 0, 1, 1]).negamax(Player.TWO, 8, -INF, INF)
+        2
+        """
+        return _negamax(self.rules, self.bits, player, depth, alpha, beta, self._tt)
 
     def hypothetical_moves(self, player: Player) -> Dict[Pot, int]:
         """
-        Return average win margin of each possible move
+        Return the win margin of each possible move, from the point
+        of view of the player making it
 
         >>> State([0, 1, 1, 0, 1, 1]).hypothetical_moves(Player.ONE)  # p1 is guaranteed win by 2 if they choose pot 1
-        {1: 2.0, 2: -2.0}
+        {1: 2, 2: -2}
         """
         results = {}
         for n in self.possible_moves(player):
-            hypothetical = self.move(player, n)
-            results[n] = 0
-            for x in range(self.runs):
-                results[n] += hypothetical.tree(player.other)
-
-            # results = odds of p1 winning
-            if player == Player.TWO:
-                results[n] *= -1
-
-        # normalise to average margin of victory for each option
-        for n in results:
-            results[n] /= self.runs
-
+            bits = _apply(self.rules, self.bits, player, n)
+            results[n] = -_negamax(self.rules, bits, 1 - player, self.depth - 1, -INF, INF, self._tt)
         return results
 
     def suggest(self, player: Player) -> Optional[Pot]:
         """
         Given a bunch of moves, select the one that gives the best
-        chance of winning
+        chance of winning.
+
+        We search one move ahead, then two, and so on up to self.depth,
+        stopping early if we go over self.time_limit seconds. Each search
+        is mostly answered from the transposition table and best moves
+        left behind by the one before, so the shallow ones are cheap.
 
         >>> State([0, 1, 1, 0, 1, 1]).suggest(Player.ONE)  # p1 is guaranteed win if they take pot 1
         1
+        >>> State([0, 1, 1, 0, 1, 1], time_limit=0).suggest(Player.ONE)
+        1
+        >>> State([1, 0, 0, 1, 1, 1]).suggest(Player.ONE)  # no moves
         """
-        results = self.hypothetical_moves(player)
-        if self.verbose:
-            print(results)
-        if not results:
+        if not _legal_moves(self.rules, self.bits, player):
             return None
-        best = sorted([(v, k) for k, v in results.items()])[-1][1]
+
+        start = time.monotonic()
+        score = 0
+        best = None
+        for depth in range(1, self.depth + 1):
+            if best is None:
+                alpha, beta = -INF, INF
+            else:
+                alpha, beta = score - ASPIRATION_WINDOW, score + ASPIRATION_WINDOW
+            score, pot = _search_root(self.rules, self.bits, player, depth, alpha, beta, self._tt, best)
+            if score <= alpha or score >= beta:
+                score, pot = _search_root(self.rules, self.bits, player, depth, -INF, INF, self._tt, best)
+            best = pot
+            if self.verbose:
+                print(f"depth {depth}: pot {best} wins by {score}")
+            if self.time_limit is not None and time.monotonic() - start >= self.time_limit:
+                break
         return best
 
     @property
@@ -307,6 +413,165 @@ class State:
         return ','.join([str(x) for x in self.board])
 
 
+# The search itself works on raw bits rather than State objects, using
+# the Rules for the board's size, so that each node is plain int
+# arithmetic with no objects to create or methods to call
+
+def _apply(rules: Rules, bits: int, player: int, src_pos: Pot) -> int:
+    """
+    The bits after `player` moves from a non-empty `src_pos`
+    """
+    offset = rules.OFFSETS[player]
+    shift = (offset + src_pos) * PACK_SHIFT
+
+    # pick up beads from the given spot
+    beads = (bits >> shift) & PACK_MASK
+    bits -= beads << shift
+
+    # drop off beads around the board - as many full laps as
+    # we can, then whatever is left over
+    path = rules.SOW_PATH[player][src_pos]
+    deltas = rules.SOW_DELTA[player][src_pos]
+    laps, rest = divmod(beads, len(path))
+    bits += laps * deltas[-1] + deltas[rest]
+    final_pos = path[(beads - 1) % len(path)]
+
+    # if our final bead is placed in an empty space on our side (ie,
+    # it has 1 now), then claim any beads opposite
+    if rules.IS_OWN[player][final_pos] and (bits >> (final_pos * PACK_SHIFT)) & PACK_MASK == 1:
+        opposite_shift = rules.OPPOSITE[final_pos] * PACK_SHIFT
+        claimed = (bits >> opposite_shift) & PACK_MASK
+        bits += (claimed << (offset * PACK_SHIFT)) - (claimed << opposite_shift)
+
+    return bits
+
+
+def _legal_moves(rules: Rules, bits: int, player: int) -> int:
+    """
+    The non-empty pots on `player`'s side, as a mask with the top bit
+    of each pot set - adding the low bits of a pot to all-ones carries
+    into the top bit if any of them were set
+    """
+    side = bits & rules.SIDE_MASK[player]
+    return (((side & rules.POT_LOW) + rules.POT_LOW) | side) & rules.POT_HIGH
+
+
+def _p1_wins_by(rules: Rules, bits: int) -> int:
+    top = (rules.END - 1) * PACK_SHIFT
+    s1 = ((bits & rules.P1_MASK) * rules.ONES >> top) & PACK_MASK
+    s2 = ((bits >> rules.SIDE_SHIFT) * rules.ONES >> top) & PACK_MASK
+    # return (s1>s2)-(s1<s2)
+    return s1 - s2
+
+
+def _ordered_children(rules: Rules, bits: int, player: int, best_pot: Optional[Pot]) -> List[tuple]:
+    """
+    The positions after each of `player`'s moves, as (_, _, pot, bits).
+
+    Alpha-beta cuts off more when the best moves come first, so these
+    start with `best_pot` (the best move from any earlier search of this
+    position), and then the moves which leave the most in our base (ie,
+    captures).
+    """
+    base_shift = rules.OFFSETS[player] * PACK_SHIFT
+    pot_of_bit = rules.POT_OF_BIT
+    children = []
+    moves = _legal_moves(rules, bits, player)
+    while moves:
+        bit = moves & -moves
+        moves ^= bit
+        pot = pot_of_bit[bit]
+        child = _apply(rules, bits, player, pot)
+        children.append((pot == best_pot, (child >> base_shift) & PACK_MASK, pot, child))
+    children.sort(reverse=True)
+    return children
+
+
+def _search_root(rules: Rules, bits: int, player: int, depth: int, alpha: float, beta: float, tt: Dict[int, tuple], best_pot: Optional[Pot]) -> Tuple[float, Optional[Pot]]:
+    """
+    Like _negamax(), but also returns which pot gave the best score.
+    If the score is outside of (alpha, beta) the pot isn't reliable.
+    """
+    best = -INF
+    for _, _, pot, child in _ordered_children(rules, bits, player, best_pot):
+        score = -_negamax(rules, child, 1 - player, depth - 1, -beta, -alpha, tt)
+        if score > best:
+            best = score
+            best_pot = pot
+        alpha = max(alpha, score)
+        if alpha >= beta:
+            break
+    return best, best_pot
+
+
+def _negamax(rules: Rules, bits: int, player: int, depth: int, alpha: float, beta: float, tt: Dict[int, tuple]) -> int:
+    """
+    Alpha-beta search - the win margin for `player`, to move, if both
+    sides play their best for `depth` more moves.
+
+    This gives the same scores as a plain minimax search:
+
+    >>> def minimax(s, player, depth):
+    ...     moves = s.possible_moves(player)
+    ...     if depth == 0 or not moves or not s.possible_moves(Player(1 - player)):
+    ...         return s.p1_wins_by() * (-1 if player else 1)
+    ...     return max(-minimax(s.move(player, n), Player(1 - player), depth - 1) for n in moves)
+    >>> s = State([0, 3, 3, 3, 3, 3, 3, 0, 3, 3, 3, 3, 3, 3], depth=5)
+    >>> scores = s.hypothetical_moves(Player.ONE)
+    >>> scores == {n: -minimax(s.move(Player.ONE, n), Player.TWO, 4) for n in s.possible_moves(Player.ONE)}
+    True
+    >>> _negamax(s.rules, s.bits, Player.ONE, 5, -INF, INF, {}) == max(scores.values())
+    True
+    >>> best, pot = _search_root(s.rules, s.bits, Player.ONE, 5, -INF, INF, {}, None)
+    >>> best == scores[pot] == max(scores.values())
+    True
+    """
+    if depth <= 0 or not bits & rules.SIDE_MASK[player] or not bits & rules.SIDE_MASK[1 - player]:
+        score = _p1_wins_by(rules, bits)
+        return -score if player else score
+
+    # the game is the same from either side, so a position with player
+    # two to move has the same score (and best pot) as the position with
+    # the sides swapped round and player one to move - store them together
+    if player:
+        key = (bits >> rules.SIDE_SHIFT) | ((bits & rules.P1_MASK) << rules.SIDE_SHIFT)
+    else:
+        key = bits
+    entry = tt.get(key)
+    best_pot = None
+    if entry is not None:
+        entry_depth, flag, value, best_pot = entry
+        if entry_depth >= depth:
+            if flag == EXACT:
+                return value
+            if flag == LOWER:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                return value
+
+    original_alpha = alpha
+    best = -INF
+    for _, _, pot, child in _ordered_children(rules, bits, player, best_pot):
+        score = -_negamax(rules, child, 1 - player, depth - 1, -beta, -alpha, tt)
+        if score > best:
+            best = score
+            best_pot = pot
+        alpha = max(alpha, score)
+        if alpha >= beta:
+            break
+
+    if best <= original_alpha:
+        flag = UPPER
+    elif best >= beta:
+        flag = LOWER
+    else:
+        flag = EXACT
+    tt[key] = (depth, flag, best, best_pot)
+    return best
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("board", type=int, nargs="*", default=[0, 3, 3, 3, 3, 3, 3, 0, 3, 3, 3, 3, 3, 3])
@@ -315,13 +580,18 @@ def main():
     parser.add_argument("-p", "--human-p1", action="store_true", default=False)
     parser.add_argument("-q", "--human-p2", action="store_true", default=False)
     parser.add_argument("-v", "--verbose", action="store_true", default=False)
-    parser.add_argument("-r", "--runs", type=int, default=1000)
+    parser.add_argument("-d", "--depth", type=int, default=8)
+    parser.add_argument("-t", "--time-limit", type=float, default=None)
     args = parser.parse_args()
 
-    assert 4 <= len(args.board) <= 100
-    assert 0 < args.runs <= 1000
+    if not 4 <= len(args.board) <= 100 or len(args.board) % 2:
+        parser.error(f"board must have an even number of pots, from 4 to 100, not {len(args.board)}")
+    if min(args.board) < 0 or sum(args.board) > PACK_MASK:
+        parser.error(f"board must have from 0 to {PACK_MASK} beads in total, not {sum(args.board)}")
+    if not 0 < args.depth <= 20:
+        parser.error(f"depth must be from 1 to 20, not {args.depth}")
 
-    s = State(args.board, args.runs, args.verbose)
+    s = State(args.board, args.depth, args.verbose, args.time_limit)
     if args.move_p1 or args.move_p2:
         if args.move_p1:
             s = s.move(Player.ONE, s.suggest(Player.ONE))
@@ -383,6 +653,37 @@ if __name__ == "__main__":
         pass
 
 
+@functools.lru_cache(maxsize=4096)
+def _parse_state(raw_state: str) -> Tuple[int, ...]:
+    """
+    Game URLs get loaded over and over (reloads, the back button), so
+    remember the pots for recent ones. The pages only have room for
+    the standard 14-pot board, so that's the only size accepted.
+
+    >>> _parse_state("0,3,3,3,3,3,3,0,3,3,3,3,3,3")
+    (0, 3, 3, 3, 3, 3, 3, 0, 3, 3, 3, 3, 3, 3)
+    >>> _parse_state("0,1,1,0,1,1")
+    Traceback (most recent call last):
+    ...
+    ValueError: Invalid state: 0,1,1,0,1,1
+    >>> _parse_state("0,3,3,3,3,3,x,0,3,3,3,3,3,3")
+    Traceback (most recent call last):
+    ...
+    ValueError: Invalid state: 0,3,3,3,3,3,x,0,3,3,3,3,3,3
+    >>> _parse_state("0,200,0,0,0,0,0,0,0,0,0,0,0,100")
+    Traceback (most recent call last):
+    ...
+    ValueError: Invalid state: 300 beads, the most is 255
+    """
+    pots = raw_state.split(',')
+    if not (len(pots) == 14 and all(pot.isdigit() for pot in pots)):
+        raise ValueError(f"Invalid state: {raw_state}")
+    board = tuple(int(x) for x in pots)
+    if sum(board) > PACK_MASK:
+        raise ValueError(f"Invalid state: {sum(board)} beads, the most is {PACK_MASK}")
+    return board
+
+
 def main_web(args):
     from aiohttp import web
 
@@ -398,7 +699,7 @@ def main_web(args):
             .game TFOOT TD, .game TBODY TD:nth-child(1) {background-color: #AFA;}
             .game THEAD TD, .game TBODY TD:nth-child(2) {background-color: #FAA;}
             .game BUTTON {border: none; background: #AFA; font-family: sans;}
-            .game TBODY TD {width: 50%%;}
+            .game TBODY TD {width: 50%;}
             .game TD, .game BUTTON {font-size: 7vh;}
 
             @media only screen and (min-width: 1024px) {
@@ -407,56 +708,64 @@ def main_web(args):
             }
         </style>
     </head>
-    <body>%s</body>
+    <body>$body</body>
 </html>
 """
 
-    async def game(request: web.Request):
-        raw_state = request.match_info.get(
-            'state',
-            '0,3,3,3,3,3,3,0,3,3,3,3,3,3'
-        )
-        state = State([int(x) for x in raw_state.split(',')])
-        return web.Response(content_type="text/html", text=template % f"""
-        <form action="/move/{raw_state}" method="POST">
+    def compile_page(body: str) -> string.Template:
+        # the page is static apart from the body, so fill that in once
+        # and leave a template for just the per-request values
+        return string.Template(string.Template(template).substitute(body=body))
+
+    def load_state(raw_state: str) -> State:
+        try:
+            return State(_parse_state(raw_state))
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=str(e))
+
+    def pots(state: State) -> Dict[str, int]:
+        return {f"p{pos}": beads for pos, beads in enumerate(state.board)}
+
+    game_page = compile_page("""
+        <form action="/move/$state" method="POST">
             <h1>Mancala</h1>
 
             <div class="game">
             <table border="1">
                 <thead>
                     <tr>
-                        <td colspan="2">{state.board[7]}</td>
+                        <td colspan="2">$p7</td>
                     </tr>
                 </thead>
                 <tbody>
                     <tr>
-                        <td><button type="submit" name="pot" value="6">{state.board[6]}</button></td>
-                        <td>{state.board[8]}</td>
+                        <td><button type="submit" name="pot" value="6">$p6</button></td>
+                        <td>$p8</td>
                     </tr>
                     <tr>
-                        <td><button type="submit" name="pot" value="5">{state.board[5]}</button></td>
-                        <td>{state.board[9]}</td>
+                        <td><button type="submit" name="pot" value="5">$p5</button></td>
+                        <td>$p9</td>
                     </tr>
                     <tr>
-                        <td><button type="submit" name="pot" value="4">{state.board[4]}</button></td>
-                        <td>{state.board[10]}</td>
+                        <td><button type="submit" name="pot" value="4">$p4</button></td>
+                        <td>$p10</td>
                     </tr>
                     <tr>
-                        <td><button type="submit" name="pot" value="3">{state.board[3]}</button></td>
-                        <td>{state.board[11]}</td>
+                        <td><button type="submit" name="pot" value="3">$p3</button></td>
+                        <td>$p11</td>
                     </tr>
                     <tr>
-                        <td><button type="submit" name="pot" value="2">{state.board[2]}</button></td>
-                        <td>{state.board[12]}</td>
+                        <td><button type="submit" name="pot" value="2">$p2</button></td>
+                        <td>$p12</td>
                     </tr>
                     <tr>
-                        <td><button type="submit" name="pot" value="1">{state.board[1]}</button></td>
-                        <td>{state.board[13]}</td>
+                        <td><button type="submit" name="pot" value="1">$p1</button></td>
+                        <td>$p13</td>
                     </tr>
                 </tbody>
                 <tfoot>
                     <tr>
-                        <td colspan="2">{state.board[0]}</td>
+                        <td colspan="2">$p0</td>
                     </tr>
                 </tfoot>
             </table>
@@ -477,12 +786,65 @@ def main_web(args):
         </form>
         """)
 
+    end_page = compile_page("""
+            <h1>$title</h1>
+            <div class="game">
+            <table border="1">
+                <thead>
+                    <tr>
+                        <td colspan="2">$p7</td>
+                    </tr>
+                </thead>
+                <tbody>
+                    <tr>
+                        <td>$p6</td>
+                        <td>$p8</td>
+                    </tr>
+                    <tr>
+                        <td>$p5</td>
+                        <td>$p9</td>
+                    </tr>
+                    <tr>
+                        <td>$p4</td>
+                        <td>$p10</td>
+                    </tr>
+                    <tr>
+                        <td>$p3</td>
+                        <td>$p11</td>
+                    </tr>
+                    <tr>
+                        <td>$p2</td>
+                        <td>$p12</td>
+                    </tr>
+                    <tr>
+                        <td>$p1</td>
+                        <td>$p13</td>
+                    </tr>
+                </tbody>
+                <tfoot>
+                    <tr>
+                        <td colspan="2">$p0</td>
+                    </tr>
+                </tfoot>
+            </table>
+            </div>
+            <h2><a href="/">Play Again</a></h2>
+        """)
+
+    async def game(request: web.Request):
+        raw_state = request.match_info.get(
+            'state',
+            '0,3,3,3,3,3,3,0,3,3,3,3,3,3'
+        )
+        state = load_state(raw_state)
+        return web.Response(content_type="text/html", text=game_page.substitute(pots(state), state=raw_state))
+
     async def move(request: web.Request):
         raw_state = request.match_info['state']
         post_data = await request.post()
         move1 = Pot(int(post_data['pot']))
 
-        state = State([int(x) for x in raw_state.split(',')])
+        state = load_state(raw_state)
         if move1 not in state.possible_moves(Player.ONE):
             raise web.HTTPTemporaryRedirect(f"/game/{state.to_web}")
 
@@ -502,7 +864,7 @@ def main_web(args):
             'state',
             '0,3,3,3,3,3,3,0,3,3,3,3,3,3'
         )
-        state = State([int(x) for x in raw_state.split(',')])
+        state = load_state(raw_state)
         p1w = state.p1_wins_by()
         if p1w == 0:
             title = "Draw!"
@@ -510,50 +872,7 @@ def main_web(args):
             title = f"Human wins by {p1w}!"
         else:
             title = f"AI wins by {-p1w}!"
-        return web.Response(content_type="text/html", text=template % f"""
-            <h1>{title}</h1>
-            <div class="game">
-            <table border="1">
-                <thead>
-                    <tr>
-                        <td colspan="2">{state.board[7]}</td>
-                    </tr>
-                </thead>
-                <tbody>
-                    <tr>
-                        <td>{state.board[6]}</td>
-                        <td>{state.board[8]}</td>
-                    </tr>
-                    <tr>
-                        <td>{state.board[5]}</td>
-                        <td>{state.board[9]}</td>
-                    </tr>
-                    <tr>
-                        <td>{state.board[4]}</td>
-                        <td>{state.board[10]}</td>
-                    </tr>
-                    <tr>
-                        <td>{state.board[3]}</td>
-                        <td>{state.board[11]}</td>
-                    </tr>
-                    <tr>
-                        <td>{state.board[2]}</td>
-                        <td>{state.board[12]}</td>
-                    </tr>
-                    <tr>
-                        <td>{state.board[1]}</td>
-                        <td>{state.board[13]}</td>
-                    </tr>
-                </tbody>
-                <tfoot>
-                    <tr>
-                        <td colspan="2">{state.board[0]}</td>
-                    </tr>
-                </tfoot>
-            </table>
-            </div>
-            <h2><a href="/">Play Again</a></h2>
-        """)
+        return web.Response(content_type="text/html", text=end_page.substitute(pots(state), title=title))
 
     app = web.Application()
     app.router.add_get('/', game)